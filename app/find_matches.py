@@ -1,4 +1,5 @@
-from typing import List, Tuple, Union
+import os
+from typing import List, Tuple
 
 import numpy as np
 from sklearn.metrics.pairwise import (
@@ -7,7 +8,8 @@ from sklearn.metrics.pairwise import (
     manhattan_distances,
 )
 
-from app.utils.load_functions import load_resources
+from app.utils.cache_functions import MatchCache
+from app.utils.load_functions import load_resources, resources_hash
 from app.utils.preprocess_functions import (
     abbr_preprocess_text,
     lemmatize_text,
@@ -29,6 +31,47 @@ REGION_DICT = load_resources("region_dict", "joblib")
 BLACKLIST_OPF = load_resources("blacklist_opf", "joblib")
 STOP_WORDS_LIST = load_resources("stop_words_list", "joblib")
 
+# Параметры поиска совпадений
+MATCH_PARAMS = {
+    "top_k": 5,
+    "threshold": 0.00000001,
+    "filter_by_region": True,
+    "empty_region": "all",  # is ignored if filter_by_region=False
+    "similarity_method": "cosine",
+}
+
+# Версия алгоритма поиска совпадений, входит в версию записей кэша.
+# Увеличивается при изменении результатов поиска при тех же ресурсах
+MATCH_SCORER_VERSION = "2"
+
+# Персистентный кэш совпадений, включается переменной окружения MATCH_CACHE_PATH
+MATCH_CACHE_PATH = os.getenv("MATCH_CACHE_PATH")
+MATCH_CACHE = (
+    MatchCache(
+        MATCH_CACHE_PATH,
+        version=MATCH_SCORER_VERSION
+        + "-"
+        + resources_hash(
+            [
+                "vectorizer",
+                "reference_vec",
+                "reference_id",
+                "reference_region",
+                "reference_name",
+                "abbreviations_dict",
+                "region_dict",
+                "blacklist_opf",
+                "stop_words_list",
+            ],
+            "joblib",
+        ),
+        max_entries=int(os.getenv("MATCH_CACHE_MAX_ENTRIES", "100000")),
+        evict_interval=float(os.getenv("MATCH_CACHE_EVICT_INTERVAL", "60")),
+    )
+    if MATCH_CACHE_PATH
+    else None
+)
+
 
 def calculate_similarity(
     x: np.ndarray, y: np.ndarray, method: str = "cosine"
@@ -61,7 +104,7 @@ def calculate_similarity(
         raise ValueError(f"Unknown similarity method: {method}")
 
 
-def find_matches(
+def find_matches_batch(
     x_vec: np.ndarray,
     x_region: np.ndarray,
     reference_id: np.ndarray,
@@ -72,10 +115,14 @@ def find_matches(
     filter_by_region: bool = True,
     empty_region: str = "all",
     similarity_method: str = "cosine",
-) -> Tuple[List[List[Tuple[Union[int, None], float]]], List[np.ndarray]]:
+    block_size: int = 1024,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    Находит совпадения для заданных векторов с использованием
-    различных методов схожести и фильтрации по регионам.
+    Находит совпадения для набора векторов, обрабатывая запросы блоками.
+
+    Запросы группируются по регионам, схожесть для каждой группы
+    вычисляется одним произведением матриц запросов и референсов региона,
+    отбор по порогу и top-k выполняются над массивами целиком.
 
     Parameters
     ----------
@@ -99,162 +146,208 @@ def find_matches(
         Способ обработки, если в текущем регионе нет школ для сравнения (default is "all").
     similarity_method : str, optional
         Метод вычисления схожести (default is "cosine").
+    block_size : int, optional
+        Максимальное количество запросов в одном произведении матриц
+        (default is 1024).
 
     Returns
     -------
-    Tuple[List[List[Tuple[Union[int, None], float]]], List[np.ndarray]]
-        Список совпадений и список для ручной обработки.
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        Массив id совпадений размера (n, top_k) (-1, если совпадения нет),
+        массив оценок размера (n, top_k) и маска запросов для ручной обработки.
     """
-    y_pred = []
-    manual_review = []
+    n = x_vec.shape[0]
+    match_ids = np.full((n, top_k), -1, dtype=np.int64)
+    match_scores = np.zeros((n, top_k), dtype=np.float64)
+    manual_review = np.zeros(n, dtype=bool)
+
+    # Группируем запросы по регионам
+    if filter_by_region:
+        groups = {}
+        for i, region in enumerate(x_region):
+            groups.setdefault(region, []).append(i)
+    else:
+        groups = {None: list(range(n))}
 
-    for i, x in enumerate(x_vec):
-        # Фильтруем reference_vec и reference_id по текущему региону,
-        # если включена фильтрация по регионам
+    for region, indices in groups.items():
+        indices = np.asarray(indices)
         if filter_by_region:
-            # Фильтруем reference_vec и reference_id по текущему региону
-            current_region = x_region[i]
-            region_mask = reference_region == current_region
+            region_mask = reference_region == region
             filtered_reference_vec = reference_vec[region_mask]
             filtered_reference_id = reference_id[region_mask]
 
-            # Способ обработки, если в текущем регионе нет школ для сравнения
-            if empty_region == "all":
-                # Если в текущем регионе нет школ для сравнения, используем все школы
-                if filtered_reference_vec.shape[0] == 0:
+            if filtered_reference_vec.shape[0] == 0:
+                if empty_region == "all":
+                    # Если в текущем регионе нет школ для сравнения,
+                    # используем все школы
                     filtered_reference_vec = reference_vec
                     filtered_reference_id = reference_id
-            else:
-                if filtered_reference_vec.shape[0] == 0:
+                else:
                     # Если в текущем регионе нет школ для сравнения,
                     # то помечаем на ручную обработку
-                    manual_review.append(x)
-                    top_matches = [(None, 0.0)] * top_k
-                    y_pred.append(top_matches)
+                    manual_review[indices] = True
                     continue
         else:
             filtered_reference_vec = reference_vec
             filtered_reference_id = reference_id
 
-        # Вычисляем выбранное расстояние
-        similarities = calculate_similarity(
-            x, filtered_reference_vec, method=similarity_method
-        ).flatten()
-        top_indices = similarities.argsort()[-top_k:][::-1]
-        max_similarity = max(similarities)
-
-        # Учитываем пороговое значение для различных методов
-        if similarity_method == "cosine":
-            if max_similarity < threshold:
-                manual_review.append(x)
-                top_matches = [(None, 0.0)] * top_k
-            else:
-                top_matches = [
-                    (filtered_reference_id[i], similarities[i]) for i in top_indices
-                ]
-                if len(top_matches) < top_k:
-                    top_matches += [(None, 0.0)] * (top_k - len(top_matches))
-        else:  # Для других методов расстояний (евклидово и манхэттенское)
-            if max_similarity > -threshold:  # Обратим внимание на инверсию
-                manual_review.append(x)
-                top_matches = [(None, 0.0)] * top_k
-            else:
-                top_matches = [
-                    (filtered_reference_id[i], -similarities[i]) for i in top_indices
-                ]
-                if len(top_matches) < top_k:
-                    top_matches += [(None, 0.0)] * (top_k - len(top_matches))
-
-        y_pred.append(top_matches)
-
-    return y_pred, manual_review
-
-
-def predict(school_name: str) -> List[int]:
+        k = min(top_k, filtered_reference_vec.shape[0])
+        for start in range(0, len(indices), block_size):
+            block = indices[start : start + block_size]
+
+            # Вычисляем выбранное расстояние для всего блока запросов
+            similarities = calculate_similarity(
+                x_vec[block], filtered_reference_vec, method=similarity_method
+            )
+
+            # Отбираем top-k той же сортировкой, что и при построчной обработке,
+            # чтобы порядок совпадений с равной схожестью не менялся
+            top_indices = np.argsort(similarities, axis=1)[:, -k:][:, ::-1]
+            top_similarities = np.take_along_axis(similarities, top_indices, axis=1)
+            max_similarity = top_similarities[:, 0]
+
+            # Учитываем пороговое значение для различных методов
+            if similarity_method == "cosine":
+                review = max_similarity < threshold
+                scores = top_similarities
+            else:  # Для других методов расстояний (евклидово и манхэттенское)
+                review = max_similarity > -threshold  # Обратим внимание на инверсию
+                scores = -top_similarities
+
+            accepted = block[~review]
+            match_ids[accepted, :k] = filtered_reference_id[top_indices[~review]]
+            match_scores[accepted, :k] = scores[~review]
+            manual_review[block[review]] = True
+
+    return match_ids, match_scores, manual_review
+
+
+def preprocess_name(x: str) -> str:
     """
-    Предсказывает соответствия для заданного названия школы.
+    Предобрабатывает название школы.
 
     Parameters
     ----------
-    school_name : str
+    x : str
         Название школы.
 
     Returns
     -------
-    List[int]
-        Список id наиболее вероятных совпадений.
+    str
+        Предобработанное название школы.
     """
+    x = simple_preprocess_text(x)
+    x = replace_numbers_with_text(x)
+    x = abbr_preprocess_text(x, ABBR_DICT, False, False, True, False)
+    x = process_region(x, REGION_DICT)
+    x = remove_substrings(x, BLACKLIST_OPF)
+    x = lemmatize_text(x, STOP_WORDS_LIST)
+    x = remove_short_words(x)
+    return x
 
-    def preprocess_name(x: str) -> str:
-        """
-        Предобрабатывает название школы.
-
-        Parameters
-        ----------
-        x : str
-            Название школы.
-
-        Returns
-        -------
-        str
-            Предобработанное название школы.
-        """
-        x = simple_preprocess_text(x)
-        x = replace_numbers_with_text(x)
-        x = abbr_preprocess_text(x, ABBR_DICT, False, False, True, False)
-        x = process_region(x, REGION_DICT)
-        x = remove_substrings(x, BLACKLIST_OPF)
-        x = lemmatize_text(x, STOP_WORDS_LIST)
-        x = remove_short_words(x)
-        return x
-
-    def preprocess_region(x: str) -> str:
-        """
-        Предобрабатывает регион школы.
-
-        Parameters
-        ----------
-        x : str
-            Название школы.
-
-        Returns
-        -------
-        str
-            Регион школы.
-        """
-        x = simple_preprocess_text(x)
-        x = replace_numbers_with_text(x)
-        x = abbr_preprocess_text(x, ABBR_DICT, False, False, True, False)
-        return process_region(x, REGION_DICT, return_region=True)
-
-    vectorized_preprocess = np.vectorize(preprocess_name)
-    vectorized_region = np.vectorize(preprocess_region)
-
-    x = vectorized_preprocess(np.array([school_name]))
-    region = vectorized_region(np.array([school_name]))
-
-    # Векторизация текста
-    x_vec = VECTORIZER.transform(x)
-
-    y_pred, manual_review = find_matches(
-        x_vec,
-        region,
-        REFERENCE_ID,
-        REFERENCE_VEC,
-        REFERENCE_REGION,
-        top_k=5,
-        threshold=0.00000001,
-        filter_by_region=True,
-        empty_region="all",  # is ignored if filter_by_region=False
-        similarity_method="cosine",
-    )
 
-    converted_results = [
-        {
-            "id": int(id_) if id_ is not None else -1,
-            "score": float(score),
-        }
-        for id_, score in y_pred[0]
+def preprocess_region(x: str) -> str:
+    """
+    Предобрабатывает регион школы.
+
+    Parameters
+    ----------
+    x : str
+        Название школы.
+
+    Returns
+    -------
+    str
+        Регион школы.
+    """
+    x = simple_preprocess_text(x)
+    x = replace_numbers_with_text(x)
+    x = abbr_preprocess_text(x, ABBR_DICT, False, False, True, False)
+    return process_region(x, REGION_DICT, return_region=True)
+
+
+def predict_batch(school_names: List[str]) -> List[List[dict]]:
+    """
+    Предсказывает соответствия для списка названий школ.
+
+    Названия векторизуются одним вызовом, результаты возвращаются в
+    порядке входного списка. Если задана переменная окружения
+    MATCH_CACHE_PATH, результаты сохраняются в персистентный кэш по
+    нормализованному запросу.
+
+    Parameters
+    ----------
+    school_names : List[str]
+        Названия школ.
+
+    Returns
+    -------
+    List[List[dict]]
+        Списки наиболее вероятных совпадений для каждого названия.
+    """
+    # Удаляем точные дубликаты до дорогой предобработки
+    unique_names = list(dict.fromkeys(school_names))
+    names = [preprocess_name(school_name) for school_name in unique_names]
+    regions = [preprocess_region(school_name) for school_name in unique_names]
+
+    # Удаляем дубликаты по нормализованному ключу (название, регион)
+    query_index = {}
+    unique_positions = [
+        query_index.setdefault(query, len(query_index))
+        for query in zip(names, regions)
     ]
+    queries = list(query_index)
+
+    unique_results = [None] * len(queries)
+    cache_keys = [None] * len(queries)
+    if MATCH_CACHE is not None:
+        for i, (name, region) in enumerate(queries):
+            cache_keys[i] = MatchCache.make_key(name, region, **MATCH_PARAMS)
+            unique_results[i] = MATCH_CACHE.get(cache_keys[i])
+
+    # Обрабатываем только запросы, которых нет в кэше
+    missing = [i for i, result in enumerate(unique_results) if result is None]
+    if missing:
+        # Векторизация текста
+        x_vec = VECTORIZER.transform(np.array([queries[i][0] for i in missing]))
+        x_region = np.empty(len(missing), dtype=object)
+        x_region[:] = [queries[i][1] for i in missing]
+
+        match_ids, match_scores, manual_review = find_matches_batch(
+            x_vec,
+            x_region,
+            REFERENCE_ID,
+            REFERENCE_VEC,
+            REFERENCE_REGION,
+            **MATCH_PARAMS,
+        )
+
+        for i, ids, scores in zip(
+            missing, match_ids.tolist(), match_scores.tolist()
+        ):
+            unique_results[i] = [
+                {"id": id_, "score": score} for id_, score in zip(ids, scores)
+            ]
+            if MATCH_CACHE is not None:
+                MATCH_CACHE.set(cache_keys[i], unique_results[i])
+
+    # Возвращаем результаты на исходные позиции
+    name_positions = dict(zip(unique_names, unique_positions))
+    return [unique_results[name_positions[school_name]] for school_name in school_names]
+
+
+def predict(school_name: str) -> List[dict]:
+    """
+    Предсказывает соответствия для заданного названия школы.
+
+    Parameters
+    ----------
+    school_name : str
+        Название школы.
 
-    return converted_results
+    Returns
+    -------
+    List[dict]
+        Список id наиболее вероятных совпадений.
+    """
+    return predict_batch([school_name])[0]
@@ -1,9 +1,18 @@
-from typing import List, Optional
+import json
+from typing import AsyncIterator, List, Optional
 
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Receive, Scope, Send
 
-from app.find_matches import predict
+from app.find_matches import predict, predict_batch
+
+# Максимальное количество строк, обрабатываемых за один вызов predict_batch
+STREAM_CHUNK_SIZE = 256
+
+# Максимальная длина строки NDJSON в байтах
+STREAM_MAX_LINE_LENGTH = 4096
 
 app = FastAPI()
 
@@ -55,3 +64,157 @@ def find_school_matches(request: SchoolRequest) -> List[MatchResponse]:
         return matches
     else:
         raise HTTPException(status_code=404, detail="Matches not found")
+
+
+def parse_ndjson_line(line: str) -> str:
+    """
+    Извлекает название школы из строки NDJSON.
+
+    Строка может содержать JSON-строку или объект с полем school_name.
+
+    Parameters
+    ----------
+    line : str
+        Строка NDJSON.
+
+    Returns
+    -------
+    str
+        Название школы.
+
+    Raises
+    ------
+    ValueError
+        Если строка не содержит названия школы.
+    """
+    value = json.loads(line)
+    if isinstance(value, dict):
+        value = SchoolRequest(**value).school_name
+    if not isinstance(value, str):
+        raise ValueError("Expected a string or an object with school_name")
+    return value
+
+
+async def match_ndjson_lines(lines: List[Optional[str]]) -> AsyncIterator[str]:
+    """
+    Обрабатывает строки NDJSON блоками и возвращает строки результатов.
+
+    Parameters
+    ----------
+    lines : List[Optional[str]]
+        Непустые строки NDJSON. None обозначает строку, превысившую
+        STREAM_MAX_LINE_LENGTH.
+
+    Yields
+    ------
+    str
+        Строки NDJSON с результатами блока в порядке входных строк.
+    """
+    for start in range(0, len(lines), STREAM_CHUNK_SIZE):
+        chunk = lines[start : start + STREAM_CHUNK_SIZE]
+        school_names = []
+        errors = {}
+        for i, line in enumerate(chunk):
+            if line is None:
+                errors[i] = f"Line is longer than {STREAM_MAX_LINE_LENGTH} bytes"
+                continue
+            try:
+                school_names.append(parse_ndjson_line(line))
+            except ValueError as e:
+                errors[i] = str(e)
+
+        # Распознавание выполняется в пуле потоков, чтобы не блокировать event loop
+        matches = await run_in_threadpool(predict_batch, school_names)
+        results = iter(zip(school_names, matches))
+        records = []
+        for i in range(len(chunk)):
+            if i in errors:
+                record = {"error": errors[i]}
+            else:
+                school_name, school_matches = next(results)
+                record = {"school_name": school_name, "matches": school_matches}
+            records.append(json.dumps(record, ensure_ascii=False) + "\n")
+        yield "".join(records)
+
+
+class NDJSONStreamEndpoint:
+    """
+    Потоковое распознавание наименований школ в формате NDJSON.
+
+    Принимает поток строк NDJSON, каждая из которых содержит название
+    школы в виде JSON-строки или объекта `{"school_name": ...}`. Строки
+    обрабатываются блоками по мере поступления, результаты возвращаются
+    потоком NDJSON в порядке входных строк. Строки длиннее
+    STREAM_MAX_LINE_LENGTH не накапливаются в памяти, для них
+    возвращается запись с ошибкой, поэтому объем памяти сервера
+    ограничен размером блока.
+
+    Реализовано как ASGI-приложение, а не через StreamingResponse:
+    StreamingResponse параллельно ожидает отключения клиента на том же
+    receive и забирает у обработчика части тела запроса.
+
+    Example request:
+    {"school_name": "Примерная школа"}
+    "Другая школа, Москва"
+
+    Example response:
+    {"school_name": "Примерная школа", "matches": [{"id": 1842, "score": 0.73}, ...]}
+    {"school_name": "Другая школа, Москва", "matches": [...]}
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            }
+        )
+
+        buffer = b""
+        # Признак того, что текущая строка превысила допустимую длину
+        overflow = False
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            more_body = message.get("more_body", False)
+
+            *complete, buffer = (buffer + message.get("body", b"")).split(b"\n")
+            lines = []
+            for line in complete:
+                if overflow or len(line) > STREAM_MAX_LINE_LENGTH:
+                    lines.append(None)
+                    overflow = False
+                elif line.strip():
+                    lines.append(line.decode("utf-8", errors="replace"))
+            if overflow or len(buffer) > STREAM_MAX_LINE_LENGTH:
+                # Остаток слишком длинной строки отбрасывается до перевода строки
+                overflow = True
+                buffer = b""
+
+            if not more_body:
+                if overflow:
+                    lines.append(None)
+                elif buffer.strip():
+                    lines.append(buffer.decode("utf-8", errors="replace"))
+
+            async for records in match_ndjson_lines(lines):
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": records.encode("utf-8"),
+                        "more_body": True,
+                    }
+                )
+
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+app.add_route(
+    "/find_matches/stream/",
+    NDJSONStreamEndpoint(),
+    methods=["POST"],
+    name="find_school_matches_stream",
+)
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+
+class MatchCache:
+    """
+    Персистентный кэш результатов распознавания на базе SQLite.
+
+    Файл базы данных разделяется между воркерами uvicorn и сохраняется
+    между перезапусками. Каждая запись помечается версией (хэшем
+    референсных ресурсов), записи с другой версией не выдаются. Записи
+    разных версий хранятся независимо, поэтому при постепенном
+    обновлении старые и новые воркеры не вытесняют записи друг друга.
+    Фоновая очистка удаляет записи других версий, которые давно не
+    использовались, и наиболее давно использованные записи сверх лимита.
+
+    Parameters
+    ----------
+    path : str
+        Путь к файлу базы данных SQLite.
+    version : str
+        Версия ресурсов, для которых валидны записи кэша.
+    max_entries : int, optional
+        Максимальное количество записей в кэше (default is 100000).
+    evict_interval : float, optional
+        Интервал фоновой очистки в секундах (default is 60.0).
+    touch_interval : float, optional
+        Минимальный интервал в секундах между обновлениями времени
+        использования записи (default is 300.0).
+    stale_ttl : float, optional
+        Время в секундах, после которого неиспользуемые записи других
+        версий удаляются (default is 86400.0).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        version: str,
+        max_entries: int = 100000,
+        evict_interval: float = 60.0,
+        touch_interval: float = 300.0,
+        stale_ttl: float = 86400.0,
+    ) -> None:
+        self.path = Path(path)
+        self.version = version
+        self.max_entries = max_entries
+        self.evict_interval = evict_interval
+        self.touch_interval = touch_interval
+        self.stale_ttl = stale_ttl
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS match_cache ("
+                "key TEXT NOT NULL, "
+                "version TEXT NOT NULL, "
+                "value TEXT NOT NULL, "
+                "accessed REAL NOT NULL, "
+                "PRIMARY KEY (key, version))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS match_cache_accessed "
+                "ON match_cache (accessed)"
+            )
+
+        # Фоновая очистка, чтобы не выполнять её на пути запроса
+        self._stop = threading.Event()
+        self._evictor = threading.Thread(
+            target=self._evict_loop, name="match-cache-evictor", daemon=True
+        )
+        self._evictor.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Возвращает соединение с базой данных для текущего потока.
+
+        Returns
+        -------
+        sqlite3.Connection
+            Соединение с базой данных.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Соединение используется только своим потоком, но закрывается в close()
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            # WAL позволяет читать из нескольких процессов во время записи
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def make_key(name: str, region: Optional[str], **params: Any) -> str:
+        """
+        Формирует ключ кэша из нормализованного запроса и параметров поиска.
+
+        Parameters
+        ----------
+        name : str
+            Предобработанное название школы.
+        region : Optional[str]
+            Предобработанный регион школы.
+        **params : Any
+            Параметры поиска совпадений.
+
+        Returns
+        -------
+        str
+            Ключ кэша.
+        """
+        raw = json.dumps(
+            [name, region, params], ensure_ascii=False, sort_keys=True, default=str
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Возвращает значение из кэша или None, если записи нет.
+
+        Время использования записи обновляется не чаще, чем раз в
+        touch_interval секунд, поэтому обычное чтение не требует записи
+        в базу данных и не ждёт блокировку других воркеров.
+
+        Parameters
+        ----------
+        key : str
+            Ключ кэша.
+
+        Returns
+        -------
+        Optional[Any]
+            Сохранённое значение.
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, accessed FROM match_cache "
+                "WHERE key = ? AND version = ?",
+                (key, self.version),
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > self.touch_interval:
+                with conn:
+                    conn.execute(
+                        "UPDATE match_cache SET accessed = ? "
+                        "WHERE key = ? AND version = ?",
+                        (now, key, self.version),
+                    )
+        except sqlite3.Error:
+            # Недоступный кэш не должен ломать распознавание
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Сохраняет значение в кэш.
+
+        Parameters
+        ----------
+        key : str
+            Ключ кэша.
+        value : Any
+            Значение, сериализуемое в JSON.
+        """
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO match_cache "
+                    "(key, version, value, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, self.version, json.dumps(value), time.time()),
+                )
+        except sqlite3.Error:
+            pass
+
+    def evict(self) -> None:
+        """
+        Удаляет записи других версий, не использовавшиеся дольше stale_ttl
+        секунд, и наиболее давно использованные записи сверх лимита
+        max_entries.
+        """
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "DELETE FROM match_cache WHERE version != ? AND accessed < ?",
+                    (self.version, time.time() - self.stale_ttl),
+                )
+                conn.execute(
+                    "DELETE FROM match_cache WHERE rowid IN ("
+                    "SELECT rowid FROM match_cache ORDER BY accessed DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error:
+            pass
+
+    def _evict_loop(self) -> None:
+        """
+        Периодически запускает очистку кэша до остановки.
+        """
+        while not self._stop.wait(self.evict_interval):
+            self.evict()
+
+    def close(self) -> None:
+        """
+        Останавливает фоновую очистку и закрывает соединения с базой данных.
+        """
+        self._stop.set()
+        self._evictor.join()
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
@@ -1,5 +1,6 @@
+import hashlib
 from pathlib import Path
-from typing import Any
+from typing import Any, List
 
 import joblib
 
@@ -36,3 +37,32 @@ def load_resources(resources_type: str, file_type: str) -> Any:
         raise ValueError(f"Unsupported file type: {file_type}")
 
     return resources
+
+
+def resources_hash(resources_types: List[str], file_type: str) -> str:
+    """
+    Вычисление хэша содержимого файлов ресурсов.
+
+    Используется как версия для кэша совпадений: при обновлении
+    референсных данных хэш меняется, и устаревшие записи не выдаются.
+
+    Parameters
+    ----------
+    resources_types : List[str]
+        Типы ресурсов (например, ["vectorizer", "reference_vec"]).
+    file_type : str
+        Тип файла (например, "joblib").
+
+    Returns
+    -------
+    str
+        Шестнадцатеричная строка хэша SHA-256.
+    """
+    digest = hashlib.sha256()
+    for resources_type in resources_types:
+        model_path = Path("app/resources") / f"{resources_type}.{file_type}"
+        digest.update(resources_type.encode("utf-8"))
+        with open(model_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
@@ -1,8 +1,15 @@
+import hashlib
+import io
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 
+import pandas as pd
 import requests
 import streamlit as st
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 # Загрузка переменных окружения из файла .env
 load_dotenv(dotenv_path=".env")
@@ -10,25 +17,249 @@ load_dotenv(dotenv_path=".env")
 # Получение URL API из переменных окружения
 api_url = os.getenv("API_URL")
 
+# Количество строк файла в одном запросе и количество параллельных запросов
+CHUNK_SIZE = 250
+MAX_WORKERS = 4
+
+# Максимальное количество блоков в кэше результатов
+MAX_CACHED_CHUNKS = 1000
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    Создает сессию с пулом соединений к API, общую для всех запросов.
+
+    Returns
+    -------
+    requests.Session
+        Сессия requests.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data
+def read_uploaded_file(file_name: str, file_bytes: bytes) -> pd.DataFrame:
+    """
+    Читает загруженный файл CSV или XLSX.
+
+    Parameters
+    ----------
+    file_name : str
+        Имя файла.
+    file_bytes : bytes
+        Содержимое файла.
+
+    Returns
+    -------
+    pd.DataFrame
+        Таблица из файла.
+    """
+    if file_name.lower().endswith(".xlsx"):
+        return pd.read_excel(io.BytesIO(file_bytes))
+    return pd.read_csv(io.BytesIO(file_bytes), sep=None, engine="python")
+
+
+@st.cache_resource
+def get_chunk_cache() -> Dict[Tuple[str, Tuple[str, ...]], List[dict]]:
+    """
+    Создает кэш результатов распознавания блоков, общий для всех сессий.
+
+    Кэш читается и пополняется только в основном потоке скрипта, поэтому
+    повторная отрисовка страницы не приводит к повторному распознаванию.
+
+    Returns
+    -------
+    Dict[Tuple[str, Tuple[str, ...]], List[dict]]
+        Результаты по ключу (URL API, названия школ блока).
+    """
+    return {}
+
+
+def post_chunk(
+    session: requests.Session, url: str, school_names: Tuple[str, ...]
+) -> List[dict]:
+    """
+    Распознает блок названий школ одним потоковым запросом к API.
+
+    Parameters
+    ----------
+    session : requests.Session
+        Сессия с пулом соединений к API.
+    url : str
+        URL API.
+    school_names : Tuple[str, ...]
+        Названия школ.
+
+    Returns
+    -------
+    List[dict]
+        Записи с ключом "matches" или "error" для каждого названия.
+
+    Raises
+    ------
+    ValueError
+        Если количество записей в ответе не совпадает с количеством названий.
+    """
+    body = "".join(
+        json.dumps(school_name, ensure_ascii=False) + "\n"
+        for school_name in school_names
+    )
+    response = session.post(
+        url + "find_matches/stream/",
+        data=body.encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    response.raise_for_status()
+    records = [json.loads(line) for line in response.iter_lines() if line]
+    if len(records) != len(school_names):
+        raise ValueError(
+            f"Expected {len(school_names)} results, got {len(records)}"
+        )
+    return records
+
+
+def records_to_frame(df: pd.DataFrame, records: List[Optional[dict]]) -> pd.DataFrame:
+    """
+    Добавляет результаты распознавания к таблице из файла.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Таблица из файла.
+    records : List[Optional[dict]]
+        Записи API для каждой строки или None, если строка еще не обработана.
+
+    Returns
+    -------
+    pd.DataFrame
+        Таблица со столбцами match_ids, match_scores и error.
+    """
+    matches = [
+        record["matches"] if record and "matches" in record else None
+        for record in records
+    ]
+    return df.assign(
+        match_ids=[
+            [match["id"] for match in m] if m is not None else None for m in matches
+        ],
+        match_scores=[
+            [match["score"] for match in m] if m is not None else None
+            for m in matches
+        ],
+        error=[record.get("error") if record else None for record in records],
+    )
+
+
 st.title("Имплементация сервиса распознавания наименований школ")
-school_name = st.text_input("Введите название школы")
-
-if st.button("Распознать наименование"):
-    if school_name:
-        # Отправка POST-запроса к API для распознавания наименования школы
-        response = requests.post(
-            api_url + "find_matches/",
-            json={"school_name": school_name},
+mode = st.radio("Режим", ["Одно название", "Загрузка файла"], horizontal=True)
+
+if mode == "Одно название":
+    school_name = st.text_input("Введите название школы")
+
+    if st.button("Распознать наименование"):
+        if school_name:
+            # Отправка POST-запроса к API для распознавания наименования школы
+            response = get_session().post(
+                api_url + "find_matches/",
+                json={"school_name": school_name},
+            )
+            if response.status_code == 200:
+                # Обработка успешного ответа от API
+                matches = response.json()
+                st.subheader("Результаты распознавания")
+                st.write(matches)
+            else:
+                # Обработка ошибок при работе с API
+                st.write(response.status_code)
+                st.write("Ошибка работы сервиса... Сообщите разработчику")
+        else:
+            # Вывод сообщения, если не введено название школы
+            st.write("Пожалуйста, введите название школы")
+else:
+    uploaded_file = st.file_uploader(
+        "Загрузите файл CSV или XLSX", type=["csv", "xlsx"]
+    )
+
+    if uploaded_file is not None:
+        file_bytes = uploaded_file.getvalue()
+        df = read_uploaded_file(uploaded_file.name, file_bytes)
+        column = st.selectbox("Столбец с названиями школ", df.columns)
+        # Результаты привязаны к файлу и выбранному столбцу
+        result_key = (
+            uploaded_file.name,
+            hashlib.sha256(file_bytes).hexdigest(),
+            column,
         )
-        if response.status_code == 200:
-            # Обработка успешного ответа от API
-            matches = response.json()
+
+        if st.button("Распознать наименования"):
+            school_names = df[column].fillna("").astype(str).tolist()
+            chunks = [
+                tuple(school_names[start : start + CHUNK_SIZE])
+                for start in range(0, len(school_names), CHUNK_SIZE)
+            ]
+            records = [None] * len(school_names)
+            session = get_session()
+            chunk_cache = get_chunk_cache()
+
+            progress = st.progress(0.0, text="Распознавание...")
+            table = st.empty()
+            try:
+                # Блоки отправляются параллельно через общий пул соединений,
+                # кэш используется только в основном потоке
+                with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                    futures = {}
+                    for i, chunk in enumerate(chunks):
+                        start = i * CHUNK_SIZE
+                        if (api_url, chunk) in chunk_cache:
+                            chunk_records = chunk_cache[(api_url, chunk)]
+                            records[start : start + len(chunk)] = chunk_records
+                        else:
+                            future = executor.submit(
+                                post_chunk, session, api_url, chunk
+                            )
+                            futures[future] = i
+                    done = len(chunks) - len(futures)
+
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        chunk_records = future.result()
+                        chunk_cache[(api_url, chunks[i])] = chunk_records
+                        while len(chunk_cache) > MAX_CACHED_CHUNKS:
+                            chunk_cache.pop(next(iter(chunk_cache)))
+                        start = i * CHUNK_SIZE
+                        records[start : start + len(chunks[i])] = chunk_records
+
+                        done += 1
+                        progress.progress(
+                            done / len(chunks),
+                            text=f"Обработано блоков: {done} из {len(chunks)}",
+                        )
+                        table.dataframe(records_to_frame(df, records))
+            except (requests.RequestException, ValueError):
+                # Обработка ошибок при работе с API
+                st.write("Ошибка работы сервиса... Сообщите разработчику")
+            else:
+                progress.progress(1.0, text="Распознавание завершено")
+                # Результаты сохраняются, чтобы пережить перерисовку страницы
+                st.session_state["bulk_result"] = {
+                    "key": result_key,
+                    "result": records_to_frame(df, records),
+                }
+                table.empty()
+
+        bulk_result = st.session_state.get("bulk_result")
+        if bulk_result is not None and bulk_result["key"] == result_key:
+            result = bulk_result["result"]
             st.subheader("Результаты распознавания")
-            st.write(matches)
-        else:
-            # Обработка ошибок при работе с API
-            st.write(response.status_code)
-            st.write("Ошибка работы сервиса... Сообщите разработчику")
-    else:
-        # Вывод сообщения, если не введено название школы
-        st.write("Пожалуйста, введите название школы")
+            st.dataframe(result)
+            st.download_button(
+                "Скачать результаты",
+                result.to_csv(index=False).encode("utf-8"),
+                file_name="matches.csv",
+                mime="text/csv",
+            )
@@ -0,0 +1,58 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app.find_matches import find_matches_batch
+
+
+def test_find_matches_batch_keeps_row_by_row_tie_order():
+    rng = np.random.default_rng(0)
+    # Бинарные векторы дают много совпадений с равной схожестью
+    reference_vec = sp.csr_matrix(rng.integers(0, 2, (50, 4)).astype(float))
+    reference_id = np.arange(100, 150)
+    reference_region = np.array(["a"] * 50, dtype=object)
+    x_vec = sp.csr_matrix(rng.integers(0, 2, (20, 4)).astype(float))
+    x_region = np.array(["a"] * 20, dtype=object)
+
+    match_ids, match_scores, manual_review = find_matches_batch(
+        x_vec,
+        x_region,
+        reference_id,
+        reference_vec,
+        reference_region,
+        top_k=5,
+        threshold=0.00000001,
+        block_size=7,
+    )
+
+    for i in range(x_vec.shape[0]):
+        # Ожидаемый результат построчной обработки
+        similarities = cosine_similarity(x_vec[i], reference_vec).flatten()
+        if similarities.max() < 0.00000001:
+            assert manual_review[i]
+            continue
+        top_indices = similarities.argsort()[-5:][::-1]
+        assert match_ids[i].tolist() == reference_id[top_indices].tolist()
+        assert np.allclose(match_scores[i], similarities[top_indices])
+
+
+def test_find_matches_batch_pads_and_marks_manual_review():
+    reference_vec = sp.csr_matrix(np.array([[1.0, 0.0], [0.0, 1.0]]))
+    reference_id = np.array([10, 20])
+    reference_region = np.array(["a", "b"], dtype=object)
+    x_vec = sp.csr_matrix(np.array([[1.0, 0.0], [1.0, 0.0]]))
+    x_region = np.array(["a", "c"], dtype=object)
+
+    match_ids, match_scores, manual_review = find_matches_batch(
+        x_vec,
+        x_region,
+        reference_id,
+        reference_vec,
+        reference_region,
+        top_k=3,
+        empty_region="manual",
+    )
+
+    assert match_ids.tolist() == [[10, -1, -1], [-1, -1, -1]]
+    assert match_scores.tolist() == [[1.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+    assert manual_review.tolist() == [False, True]
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main
+from app.main import STREAM_MAX_LINE_LENGTH, app as fastapi_app
+
+
+def fake_predict_batch(school_names):
+    return [[{"id": len(name), "score": 1.0}] for name in school_names]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app.main, "predict_batch", fake_predict_batch)
+    return TestClient(fastapi_app)
+
+
+def post_stream(client, lines):
+    def body():
+        for line in lines:
+            yield (line + "\n").encode("utf-8")
+
+    response = client.post(
+        "/find_matches/stream/",
+        content=body(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_stream_returns_all_lines_in_order(client):
+    school_names = [f"школа {i}" for i in range(1000)]
+    records = post_stream(
+        client, [json.dumps(name, ensure_ascii=False) for name in school_names]
+    )
+
+    assert [record["school_name"] for record in records] == school_names
+    assert records[0]["matches"] == [{"id": len(school_names[0]), "score": 1.0}]
+
+
+def test_stream_reports_invalid_and_long_lines(client):
+    lines = [
+        '{"school_name": "школа 1"}',
+        "not json",
+        json.dumps("x" * (STREAM_MAX_LINE_LENGTH + 1)),
+        '"школа 2"',
+    ]
+    records = post_stream(client, lines)
+
+    assert len(records) == 4
+    assert records[0]["school_name"] == "школа 1"
+    assert "error" in records[1]
+    assert "error" in records[2]
+    assert records[3]["school_name"] == "школа 2"